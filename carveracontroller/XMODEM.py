@@ -94,12 +94,18 @@ __copyright__ = ['Copyright (c) 2010 Wijnand Modderman',
 __license__ = 'MIT'
 __version__ = '0.4.5'
 
-import platform
 import logging
+import os
+import selectors
 import time
 import sys
 from functools import partial
 
+try:
+    from binascii import crc_hqx as _crc16
+except ImportError:
+    _crc16 = None
+
 # Protocol bytes
 SOH = b'\x01'
 STX = b'\x02'
@@ -110,6 +116,9 @@ NAK = b'\x15'
 CAN = b'\x16'
 CRC = b'C'
 
+# Log every getc/putc call made by the runx() driver
+DEBUG = False
+
 
 class XMODEM(object):
     '''
@@ -144,6 +153,10 @@ class XMODEM(object):
     :type mode: string
     :param pad: Padding character to make the packets match the packet size
     :type pad: char
+    :param crc_func: Function computing the CRC-16/XMODEM of a block, called
+        as ``crc_func(data, crc)``. Defaults to ``binascii.crc_hqx``, or to a
+        pure-Python routine where that is not available.
+    :type crc_func: callable
 
     '''
 
@@ -183,12 +196,13 @@ class XMODEM(object):
         0x6e17, 0x7e36, 0x4e55, 0x5e74, 0x2e93, 0x3eb2, 0x0ed1, 0x1ef0,
     ]
 
-    def __init__(self, getc, putc, mode='xmodem8k', pad=b'\x1a'):
+    def __init__(self, getc, putc, mode='xmodem8k', pad=b'\x1a', crc_func=None):
         self.getc = getc
         self.putc = putc
         self.mode = mode
         self.mode_set = False
         self.pad = pad
+        self.crc_func = crc_func or _crc16
         self.log = logging.getLogger('xmodem.XMODEM')
         self.canceled = False
 
@@ -236,6 +250,12 @@ class XMODEM(object):
                          def callback(total_packets, success_count, error_count)
         :type callback: callable
         '''
+        getc = self.getc
+        putc = self.putc
+        debug = self.log.debug
+        debug_enabled = self.log.isEnabledFor(logging.DEBUG)
+        calc_crc = self.calc_crc
+        calc_checksum = self.calc_checksum
 
         # initialize protocol
         try:
@@ -249,19 +269,19 @@ class XMODEM(object):
 
         is_stx = 1 if packet_size > 255 else 0
 
-        self.log.debug('Begin start sequence, packet_size=%d', packet_size)
+        debug('Begin start sequence, packet_size=%d', packet_size)
         error_count = 0
         crc_mode = 0
         cancel = 0
         while True:
-            char = self.getc(1)
+            char = getc(1)
             if char:
                 if char == NAK:
-                    self.log.debug('standard checksum requested (NAK).')
+                    debug('standard checksum requested (NAK).')
                     crc_mode = 0
                     break
                 elif char == CRC:
-                    self.log.debug('16-bit CRC requested (CRC).')
+                    debug('16-bit CRC requested (CRC).')
                     crc_mode = 1
                     break
                 elif char == CAN:
@@ -272,7 +292,7 @@ class XMODEM(object):
                                       'at start-sequence')
                         return None
                     else:
-                        self.log.debug('cancellation at start sequence.')
+                        debug('cancellation at start sequence.')
                         cancel = 1
                 elif char == EOT:
                     self.log.info('Transmission canceled: received EOT '
@@ -296,12 +316,23 @@ class XMODEM(object):
         sequence = 0 # 0 for md5 upload
         md5_sent = False
 
+        # every packet is assembled in place in one reusable buffer:
+        # header, data length, padded data, checksum
+        data_start = 3 + 1 + is_stx
+        data_end = data_start + packet_size
+        packet = bytearray(data_end + 1 + crc_mode)
+        packet_view = memoryview(packet)
+        pad_view = memoryview(self.pad * packet_size)
+        headers = [self._make_send_header(packet_size, seq)
+                   for seq in range(0x100)]
+        next_data = None
+
         while True:
             if self.canceled:
-                self.putc(CAN)
-                self.putc(CAN)
-                self.putc(CAN)
-                while self.getc(1, timeout):
+                putc(CAN)
+                putc(CAN)
+                putc(CAN)
+                while getc(1, timeout):
                     pass
                 self.log.info('Transmission canceled by user.')
                 self.canceled = False
@@ -312,25 +343,40 @@ class XMODEM(object):
                 data = md5.encode()
                 md5_sent = True
             else:
-                data = stream.read(packet_size)
+                if next_data is None:
+                    next_data = stream.read(packet_size)
+                data, next_data = next_data, None
                 total_packets += 1
             if not data:
                 # end of stream
-                self.log.debug('send: at EOF')
+                debug('send: at EOF')
                 break
 
-            header = self._make_send_header(packet_size, sequence)
+            data_len = len(data)
+            packet_view[0:3] = headers[sequence]
             if is_stx == 0:
-                data = b''.join([bytes([len(data) & 0xff]), data.ljust(packet_size, self.pad)])
+                packet_view[3] = data_len & 0xff
             else:
-                data = b''.join([bytes([len(data) >> 8, len(data) & 0xff]), data.ljust(packet_size, self.pad)])
-            checksum = self._make_send_checksum(crc_mode, data)
+                packet_view[3] = data_len >> 8
+                packet_view[4] = data_len & 0xff
+            packet_view[data_start:data_start + data_len] = data
+            if data_len < packet_size:
+                packet_view[data_start + data_len:data_end] = pad_view[data_len:]
+            if crc_mode:
+                crc = calc_crc(packet_view[3:data_end])
+                packet_view[data_end:] = crc.to_bytes(2, 'big')
+            else:
+                packet_view[data_end] = calc_checksum(packet_view[3:data_end])
 
             # emit packet
             while True:
-                self.log.debug('send: block %d', sequence)
-                self.putc(header + data + checksum)
-                char = self.getc(1, timeout)
+                if debug_enabled:
+                    debug('send: block %d', sequence)
+                putc(bytes(packet))
+                if next_data is None:
+                    # read ahead while this packet and its ACK are in flight
+                    next_data = stream.read(packet_size)
+                char = getc(1, timeout)
                 if char == ACK:
                     success_count += 1
                     if callable(callback):
@@ -342,7 +388,7 @@ class XMODEM(object):
                         self.log.info('Transmission canceled: received 2xCAN.')
                         return False
                     else:
-                        self.log.debug('Cancellation at Transmission.')
+                        debug('Cancellation at Transmission.')
                         cancel = 1
 
                 self.log.info('send error: expected ACK; got %r for block %d',
@@ -359,15 +405,15 @@ class XMODEM(object):
                     return False
 
             # keep track of sequence
-            sequence = (sequence + 1) % 0x100
+            sequence = (sequence + 1) & 0xff
 
         while True:
-            self.log.debug('sending EOT, awaiting ACK')
+            debug('sending EOT, awaiting ACK')
             # end of transmission
-            self.putc(EOT)
+            putc(EOT)
 
             # An ACK should be returned
-            char = self.getc(1, timeout)
+            char = getc(1, timeout)
             if char == ACK:
                 break
             else:
@@ -388,18 +434,8 @@ class XMODEM(object):
             _bytes.append(ord(SOH))
         elif packet_size == 8192:
             _bytes.append(ord(STX))
-        _bytes.extend([sequence, 0xff - sequence])
-        return bytearray(_bytes)
-
-    def _make_send_checksum(self, crc_mode, data):
-        _bytes = []
-        if crc_mode:
-            crc = self.calc_crc(data)
-            _bytes.extend([crc >> 8, crc & 0xff])
-        else:
-            crc = self.calc_checksum(data)
-            _bytes.append(crc)
-        return bytearray(_bytes)
+        _bytes.extend([sequence, ~sequence & 0xff])
+        return bytes(_bytes)
 
     def recv(self, stream, md5 = '', crc_mode=1, retry=16, timeout=1, delay=0.1, quiet=0, callback=None):
         '''
@@ -435,6 +471,10 @@ class XMODEM(object):
         :type callback: callable
 
         '''
+        getc = self.getc
+        putc = self.putc
+        debug = self.log.debug
+        debug_enabled = self.log.isEnabledFor(logging.DEBUG)
 
         # initiate protocol
         success_count = 0
@@ -449,20 +489,20 @@ class XMODEM(object):
                 self.abort(timeout=timeout)
                 return None
             elif crc_mode and error_count < (retry // 2):
-                if not self.putc(CRC):
-                    self.log.debug('recv error: putc failed, '
-                                   'sleeping for %d', delay)
+                if not putc(CRC):
+                    debug('recv error: putc failed, '
+                          'sleeping for %d', delay)
                     time.sleep(0.1)   #time.sleep(delay)
                     error_count += 1
             else:
                 crc_mode = 0
-                if not self.putc(NAK):
-                    self.log.debug('recv error: putc failed, '
-                                   'sleeping for %d', delay)
+                if not putc(NAK):
+                    debug('recv error: putc failed, '
+                          'sleeping for %d', delay)
                     time.sleep(0.1)   #time.sleep(delay)
                     error_count += 1
 
-            char = self.getc(1, timeout)
+            char = getc(1, timeout)
             if char is None:
                 self.log.warn('recv error: getc timeout in start sequence')
                 error_count += 1
@@ -471,13 +511,13 @@ class XMODEM(object):
                 if not self.mode_set:
                     self.mode = 'xmodem'
                     self.mode_set = True
-                self.log.debug('recv: SOH')
+                debug('recv: SOH')
                 break
             elif char == STX:
                 if not self.mode_set:
                     self.mode = 'xmodem8k'
                     self.mode_set = True
-                self.log.debug('recv: STX')
+                debug('recv: STX')
                 break
             elif char == CAN:
                 if cancel:
@@ -485,7 +525,7 @@ class XMODEM(object):
                                   'at start-sequence')
                     return None
                 else:
-                    self.log.debug('cancellation at start sequence.')
+                    debug('cancellation at start sequence.')
                     cancel = 1
             else:
                 error_count += 1
@@ -513,10 +553,10 @@ class XMODEM(object):
 
         while True:
             if self.canceled:
-                self.putc(CAN)
-                self.putc(CAN)
-                self.putc(CAN)
-                while self.getc(1, timeout):
+                putc(CAN)
+                putc(CAN)
+                putc(CAN)
+                while getc(1, timeout):
                     pass
                 self.log.info('Transmission canceled by user.')
                 self.canceled = False
@@ -528,7 +568,7 @@ class XMODEM(object):
                     # We received an EOT, so send an ACK and return t
                     #                     he
                     # received data length.
-                    self.putc(ACK)
+                    putc(ACK)
                     self.log.info("Transmission complete, %d bytes",
                                   income_size)
                     return income_size
@@ -539,7 +579,7 @@ class XMODEM(object):
                                       'at block %d', sequence)
                         return None
                     else:
-                        self.log.debug('cancellation at block %d', sequence)
+                        debug('cancellation at block %d', sequence)
                         cancel = 1
                 elif char == None:
                     # no data avaliable
@@ -550,7 +590,7 @@ class XMODEM(object):
                         self.abort()
                         return None
                     # get next start-of-header bytexs
-                    char = self.getc(1, 0.5)    #char = self.getc(1, timeout)
+                    char = getc(1, 0.5)    #char = self.getc(1, timeout)
                     continue
                 else:
                     err_msg = ('recv error: expected SOH, EOT; '
@@ -564,23 +604,24 @@ class XMODEM(object):
                         return None
                     else:
                         while True:
-                            if self.getc(1, timeout) == None:
+                            if getc(1, timeout) == None:
                                 break
-                        self.putc(NAK)
-                        char = self.getc(1, timeout)
+                        putc(NAK)
+                        char = getc(1, timeout)
                     continue
 
             # read sequence
             error_count = 0
             cancel = 0
-            self.log.debug('recv: data block %d', sequence)
-            seq1 = self.getc(1, timeout)
+            if debug_enabled:
+                debug('recv: data block %d', sequence)
+            seq1 = getc(1, timeout)
             if seq1 is None:
                 self.log.warn('getc failed to get first sequence byte')
                 seq2 = None
             else:
                 seq1 = ord(seq1)
-                seq2 = self.getc(1, timeout)
+                seq2 = getc(1, timeout)
                 if seq2 is None:
                     self.log.warn('getc failed to get second sequence byte')
                 else:
@@ -594,12 +635,17 @@ class XMODEM(object):
                                'got (seq1=%r, seq2=%r), '
                                'receiving next block, will NAK.',
                                sequence, seq1, seq2)
-                self.getc(2 + packet_size + 1 + crc_mode)
+                remaining = 2 + packet_size + 1 + crc_mode
+                while remaining > 0:
+                    chunk = getc(min(remaining, 1024))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
             else:
                 # sequence is ok, read packet
                 # packet_size + checksum
                 # self.log.warn('Got sequence %d', sequence)
-                data = self.getc(1 + is_stx + packet_size + 1 + crc_mode, timeout)
+                data = getc(1 + is_stx + packet_size + 1 + crc_mode, timeout)
                 if data is None:
                     self.log.warn('recv error: We got a data as None')
                     valid = None
@@ -613,10 +659,10 @@ class XMODEM(object):
                     if sequence == 0 and not md5_received:
                         md5_received = True
                         if md5.encode() == data[1 + is_stx : 33 + is_stx]:
-                            self.putc(CAN)
-                            self.putc(CAN)
-                            self.putc(CAN)
-                            while self.getc(1, timeout):
+                            putc(CAN)
+                            putc(CAN)
+                            putc(CAN)
+                            while getc(1, timeout):
                                 pass
                             return 0
                     else:
@@ -626,16 +672,16 @@ class XMODEM(object):
                         success_count = success_count + 1
                         if callable(callback):
                             callback(packet_size, success_count, error_count)
-                    self.putc(ACK)
-                    sequence = (sequence + 1) % 0x100
+                    putc(ACK)
+                    sequence = (sequence + 1) & 0xff
                     # get next start-of-header byte
-                    char = self.getc(1, timeout)
+                    char = getc(1, timeout)
                     continue
 
             # something went wrong, request retransmission
             self.log.warn('recv error: purge, requesting retransmission (NAK)')
             while True:
-                if self.getc(1, timeout) == None:
+                if getc(1, timeout) == None:
                     break
             retrans = retrans - 1
             if retrans <= 0:
@@ -643,15 +689,30 @@ class XMODEM(object):
                 self.abort()
                 return None
             # get next start-of-header byte
-            self.putc(NAK)
-            char = self.getc(1, timeout)
+            putc(NAK)
+            char = getc(1, timeout)
             continue
 
+    def recv_fd(self, fd, *args, **kwargs):
+        '''
+        Receive into a file descriptor via the XMODEM protocol, writing the
+        received blocks out in batches. Takes the same arguments and returns
+        the same values as :meth:`recv`.
+
+        :param fd: The file descriptor to write data to, it is not closed.
+        :type fd: int
+        '''
+        stream = _WritevWriter(fd)
+        try:
+            return self.recv(stream, *args, **kwargs)
+        finally:
+            stream.flush()
+
     def _verify_recv_checksum(self, crc_mode, data):
         if crc_mode:
             _checksum = bytearray(data[-2:])
             their_sum = (_checksum[0] << 8) + _checksum[1]
-            data = data[:-2]
+            data = memoryview(data)[:-2]
 
             our_sum = self.calc_crc(data)
             valid = bool(their_sum == our_sum)
@@ -662,7 +723,7 @@ class XMODEM(object):
         else:
             _checksum = bytearray([data[-1]])
             their_sum = _checksum[0]
-            data = data[:-1]
+            data = memoryview(data)[:-1]
 
             our_sum = self.calc_checksum(data)
             valid = their_sum == our_sum
@@ -683,10 +744,7 @@ class XMODEM(object):
             '0x3c'
 
         '''
-        if platform.python_version_tuple() >= ('3', '0', '0'):
-            return (sum(data) + checksum) % 256
-        else:
-            return (sum(map(ord, data)) + checksum) % 256
+        return (sum(data) + checksum) & 0xff
 
     def calc_crc(self, data, crc=0):
         '''
@@ -699,10 +757,83 @@ class XMODEM(object):
             '0x4ab3'
 
         '''
-        for char in bytearray(data):
-            crctbl_idx = ((crc >> 8) ^ char) & 0xff
-            crc = ((crc << 8) ^ self.crctable[crctbl_idx]) & 0xffff
-        return crc & 0xffff
+        return self.crc_func(data, crc)
+
+
+def _make_crc_tables(table, count=8):
+    '''
+    Build the slice-by-N lookup tables, entry ``[k][i]`` is the CRC of byte
+    ``i`` followed by ``k`` zero bytes.
+    '''
+    tables = [tuple(table)]
+    for _ in range(count - 1):
+        tables.append(tuple(((crc << 8) ^ table[crc >> 8]) & 0xffff
+                            for crc in tables[-1]))
+    return tuple(tables)
+
+
+_CRCTABLES = _make_crc_tables(XMODEM.crctable)
+
+
+def _calc_crc_fallback(data, crc=0):
+    '''Slice-by-8 CRC-16/XMODEM for interpreters without ``crc_hqx``.'''
+    t0, t1, t2, t3, t4, t5, t6, t7 = _CRCTABLES
+    if not isinstance(data, (bytes, bytearray)):
+        # memoryview slices unpack slower than a one-off copy
+        data = bytearray(data)
+    end = len(data) & ~7
+    for i in range(0, end, 8):
+        b0, b1, b2, b3, b4, b5, b6, b7 = data[i:i + 8]
+        crc = (t7[((crc >> 8) ^ b0) & 0xff] ^ t6[(crc ^ b1) & 0xff] ^
+               t5[b2] ^ t4[b3] ^ t3[b4] ^ t2[b5] ^ t1[b6] ^ t0[b7])
+    for i in range(end, len(data)):
+        crctbl_idx = ((crc >> 8) ^ data[i]) & 0xff
+        crc = ((crc << 8) ^ t0[crctbl_idx]) & 0xffff
+    return crc
+
+
+if _crc16 is None:
+    _crc16 = _calc_crc_fallback
+
+
+class _WritevWriter(object):
+    '''
+    Write-only wrapper for a file descriptor that queues the written blocks
+    and hands each batch to the kernel with a single ``os.writev`` call, or
+    one ``os.write`` per block where ``writev`` is not available.
+
+    :param fd: The file descriptor to write to.
+    :type fd: int
+    :param batch: How many blocks to queue before writing them out.
+    :type batch: int
+    '''
+
+    def __init__(self, fd, batch=64):
+        self.fd = fd
+        self.batch = batch
+        self.pending = []
+
+    def write(self, data):
+        self.pending.append(data)
+        if len(self.pending) >= self.batch:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        pending = self.pending
+        self.pending = []
+        while pending:
+            if hasattr(os, 'writev'):
+                written = os.writev(self.fd, pending)
+            else:
+                written = os.write(self.fd, pending[0])
+            # drop the blocks written in full, trim a partially written one
+            while pending and written >= len(pending[0]):
+                written -= len(pending[0])
+                pending.pop(0)
+            if written:
+                pending[0] = memoryview(pending[0])[written:]
+
 
 def _send(mode='xmodem', filename=None, timeout=30):
     '''Send a file (or stdin) using the selected mode.'''
@@ -790,8 +921,13 @@ def runx():
         usage='%prog [<options>] <send|recv> filename filename')
     parser.add_option('-m', '--mode', default='xmodem',
                       help='XMODEM mode (xmodem, xmodem8k)')
+    parser.add_option('-c', '--cpus', default=None,
+                      help='pin the transfer and the sz/rz helper to these '
+                           'CPUs, comma separated (Linux only)')
 
     options, args = parser.parse_args()
+    if DEBUG:
+        logging.basicConfig(level=logging.DEBUG)
     if len(args) != 3:
         parser.error('invalid arguments')
         return 1
@@ -800,54 +936,188 @@ def runx():
         parser.error('invalid mode')
         return 1
 
-    def _func(so, si):
-        import select
+    if options.cpus:
+        if not hasattr(os, 'sched_setaffinity'):
+            parser.error('--cpus is not supported on this platform')
+            return 1
+        # the helper inherits this affinity, keeping both ends of the pipes
+        # on the same cores and their caches warm
+        try:
+            cpus = {int(cpu) for cpu in options.cpus.split(',')}
+            if min(cpus) < 0:
+                raise ValueError(options.cpus)
+        except ValueError:
+            parser.error('invalid CPU list: {0}'.format(options.cpus))
+            return 1
+        try:
+            os.sched_setaffinity(0, cpus)
+        except (ValueError, OverflowError, OSError) as error:
+            parser.error('cannot use CPUs {0}: {1}'.format(
+                options.cpus, error))
+            return 1
 
+    def _func(so, si):
         print(('si', si))
         print(('so', so))
+        log = logging.getLogger('xmodem.runx')
+        # pipe data is read straight into one reusable buffer, unread bytes
+        # are rxview[rxstart:rxend]
+        rxbuf = bytearray(65536)
+        rxview = memoryview(rxbuf)
+        rxstart = rxend = 0
+        txbuf = bytearray()
+        # the callbacks run per packet, bind what they call up front
+        _now = time.monotonic
+
+        if sys.platform == 'win32':
+            import queue
+            import threading
+
+            # select() only accepts sockets on Windows, so a reader thread
+            # drains the pipe and getc() waits on a queue instead
+            chunks = queue.Queue()
+
+            def reader():
+                chunk = True
+                while chunk:
+                    chunk = so.read1(65536)
+                    chunks.put(chunk)
+
+            threading.Thread(target=reader, daemon=True).start()
+            leftover = b''
+
+            def fill(view, timeout):
+                nonlocal leftover
+                chunk = leftover
+                if not chunk:
+                    try:
+                        chunk = chunks.get(timeout=timeout)
+                    except queue.Empty:
+                        return None
+                    if not chunk:
+                        # keep reporting EOF to later calls
+                        chunks.put(chunk)
+                        return 0
+                count = min(len(chunk), len(view))
+                view[:count] = chunk[:count]
+                leftover = chunk[count:]
+                return count
+
+            def flush_tx(timeout=3):
+                if txbuf:
+                    si.write(txbuf)
+                    si.flush()
+                    del txbuf[:]
+                return True
+
+        else:
+            fd = so.fileno()
+            os.set_blocking(fd, False)
+            _readv = os.readv
+            si_fd = si.fileno()
+            os.set_blocking(si_fd, False)
+            _write = os.write
+            read_selector = selectors.DefaultSelector()
+            read_selector.register(so, selectors.EVENT_READ)
+            write_selector = selectors.DefaultSelector()
+            write_selector.register(si, selectors.EVENT_WRITE)
+            _select = read_selector.select
+
+            def fill(view, timeout):
+                # only wait when the pipe has nothing queued
+                try:
+                    return _readv(fd, [view])
+                except BlockingIOError:
+                    if not _select(timeout):
+                        return None
+                    return _readv(fd, [view])
+
+            def writable(timeout):
+                return bool(write_selector.select(timeout))
+
+            def flush_tx(timeout=3):
+                # write first, the pipe nearly always has room to spare
+                while txbuf:
+                    try:
+                        written = _write(si_fd, txbuf)
+                    except BlockingIOError:
+                        if not writable(timeout):
+                            return False
+                        continue
+                    del txbuf[:written]
+                return True
+
         def getc(size, timeout=3):
-            read_ready, _, _ = select.select([so], [], [], timeout)
-            if read_ready:
-                data = so.read(size)
+            nonlocal rxstart, rxend
+            # the other end only answers once our pending writes are out
+            flush_tx(timeout)
+            if rxend - rxstart < size:
+                # move the unread bytes to the front to make room
+                rxview[:rxend - rxstart] = rxview[rxstart:rxend]
+                rxend -= rxstart
+                rxstart = 0
+                deadline = _now() + timeout
+                while rxend < size:
+                    count = fill(rxview[rxend:], max(deadline - _now(), 0))
+                    if not count:
+                        break
+                    rxend += count
+
+            if rxend - rxstart >= size:
+                data = bytes(rxview[rxstart:rxstart + size])
+                rxstart += size
             else:
                 data = None
 
-            print(('getc(', repr(data), ')'))
+            if DEBUG:
+                log.debug('getc(%r)', data)
             return data
 
-        def putc(data, timeout=3):
-            _, write_ready, _ = select.select([], [si], [], timeout)
-            if write_ready:
-                si.write(data)
-                si.flush()
-                size = len(data)
-            else:
-                size = None
-
-            print(('putc(', repr(data), repr(size), ')'))
+        def putc(data, timeout=3, flush=False):
+            # coalesce control bytes, getc() flushes before awaiting a reply
+            txbuf.extend(data)
+            size = len(data)
+            if flush or len(txbuf) >= 64:
+                if not flush_tx(timeout) and len(txbuf) >= size:
+                    # none of it was written, the caller retries with the
+                    # same data; a partly written tail stays queued instead
+                    del txbuf[len(txbuf) - size:]
+                    size = None
+
+            if DEBUG:
+                log.debug('putc(%r) -> %r', data, size)
             return size
 
-        return getc, putc
+        return getc, putc, flush_tx
 
     def _pipe(*command):
+        kwargs = {}
+        if sys.version_info >= (3, 10):
+            # grow the kernel pipe buffer, ignored where unsupported
+            kwargs['pipesize'] = 1 << 20
         pipe = subprocess.Popen(command,
                                 stdout=subprocess.PIPE,
-                                stdin=subprocess.PIPE)
+                                stdin=subprocess.PIPE,
+                                bufsize=65536,
+                                **kwargs)
         return pipe.stdout, pipe.stdin
 
     if args[0] == 'recv':
-        getc, putc = _func(*_pipe('sz', '--xmodem', args[2]))
-        stream = open(args[1], 'wb')
+        getc, putc, flush = _func(*_pipe('sz', '--xmodem', args[2]))
+        fd = os.open(args[1], os.O_WRONLY | os.O_CREAT | os.O_TRUNC |
+                     getattr(os, 'O_BINARY', 0), 0o644)
         xmodem = XMODEM(getc, putc, mode=options.mode)
-        status = xmodem.recv(stream, retry=8)
+        status = xmodem.recv_fd(fd, retry=8)
+        flush()
         assert status, ('Transfer failed, status is', False)
-        stream.close()
+        os.close(fd)
 
     elif args[0] == 'send':
-        getc, putc = _func(*_pipe('rz', '--xmodem', args[2]))
+        getc, putc, flush = _func(*_pipe('rz', '--xmodem', args[2]))
         stream = open(args[1], 'rb')
         xmodem = XMODEM(getc, putc, mode=options.mode)
         sent = xmodem.send(stream, retry=8)
+        flush()
         assert sent is not None, ('Transfer failed, sent is', sent)
         stream.close()
 